@@ -21,6 +21,7 @@
 
 ################################################################################
 # A dictionary to store the cost information for different OpenAI models. It maps the model names to their respective input and output token costs.
+# Models supporting prompt caching also specify the cost of cached input tokens.
 ################################################################################
 COST_MAPPING = {
     "gpt-3.5-turbo-0613": {"input": 0.0000015, "output": 0.000002},
@@ -34,6 +35,22 @@ COST_MAPPING = {
     "gpt-4-32k-0613": {"input": 0.00006, "output": 0.00012},
     "gpt-4-turbo": {"input": 0.00001, "output": 0.00003},
     "gpt-4-turbo-2024-04-09": {"input": 0.00001, "output": 0.00003},
+    "gpt-4o": {"input": 0.0000025, "cached_input": 0.00000125, "output": 0.00001},
+    "gpt-4o-2024-08-06": {
+        "input": 0.0000025,
+        "cached_input": 0.00000125,
+        "output": 0.00001,
+    },
+    "gpt-4o-mini": {
+        "input": 0.00000015,
+        "cached_input": 0.000000075,
+        "output": 0.0000006,
+    },
+    "gpt-4o-mini-2024-07-18": {
+        "input": 0.00000015,
+        "cached_input": 0.000000075,
+        "output": 0.0000006,
+    },
 }
 FAILURE_MESSAGE = "Unable to get response"
 TOKEN_COST_DATE = "10/21/2024"
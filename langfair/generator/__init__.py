@@ -14,8 +14,10 @@
 
 from langfair.generator.counterfactual import CounterfactualGenerator
 from langfair.generator.generator import ResponseGenerator
+from langfair.generator.rate_limiter import RateLimiter
 
 __all__ = [
     "CounterfactualGenerator",
+    "RateLimiter",
     "ResponseGenerator",
 ]
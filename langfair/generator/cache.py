@@ -0,0 +1,69 @@
+# Copyright 2024 CVS Health and/or one of its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+from typing import Any, Dict
+
+
+class JSONLCache:
+    def __init__(self, path: str) -> None:
+        """
+        Append-only key-value cache persisted as a JSON Lines file. The file is read once on
+        construction and new entries are appended to it, so later entries for a key take
+        precedence over earlier ones.
+
+        Parameters
+        ----------
+        path : str
+            Path to the JSON Lines file backing the cache. Created on first write if it does not exist.
+        """
+        self.path = path
+        self._data = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._data[record["key"]] = record["value"]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Returns the cached value for `key`, or `default` if it is not cached"""
+        return self._data.get(key, default)
+
+    def update(self, records: Dict[str, Any]) -> None:
+        """Adds `records` to the cache and appends them to the backing file"""
+        if not records:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for key, value in records.items():
+                f.write(json.dumps({"key": key, "value": value}) + "\n")
+        self._data.update(records)
+
+    @staticmethod
+    def make_key(*parts: Any, digest_size: int = 64) -> str:
+        """Hashes `parts` into a cache key of `2 * digest_size` hexadecimal characters"""
+        return hashlib.blake2b(
+            "\x1f".join(map(str, parts)).encode("utf-8"), digest_size=digest_size
+        ).hexdigest()
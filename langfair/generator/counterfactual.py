@@ -8,14 +8,12 @@
 # by CVS Health to include functionality for computing
 # prompt and response token counts for OpenAI models.
 
-import asyncio
 import itertools
 import warnings
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import nltk
 import sacremoses
-from langchain_core.messages.system import SystemMessage
 from nltk.tokenize import word_tokenize
 
 from langfair.constants.cost_data import FAILURE_MESSAGE
@@ -63,6 +61,11 @@ class CounterfactualGenerator(ResponseGenerator):
         ] = None,
         use_n_param: bool = False,
         max_calls_per_min: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        rate_limiter: Optional[Union[Any, str]] = None,
+        cache_file: Optional[str] = None,
+        token_cache_file: Optional[str] = None,
+        dedupe_prompts: bool = True,
     ) -> None:
         """
         Class for parsing and replacing protected attribute words.
@@ -86,11 +89,44 @@ class CounterfactualGenerator(ResponseGenerator):
 
         max_calls_per_min : int, default=None
             [Deprecated] Use LangChain's InMemoryRateLimiter instead.
+
+        max_concurrent : int, default=None
+            Specifies the maximum number of LLM calls in flight at any time. If None, all calls are
+            dispatched at once.
+
+        rate_limiter : RateLimiter, async context manager, or 'auto', default=None
+            An asynchronous rate limiter, such as langfair's `RateLimiter` or `aiolimiter.AsyncLimiter`,
+            that is acquired before each LLM call. If a `RateLimiter` is provided, each call also consumes
+            its estimated token count (prompt tokens plus `max_tokens` of `langchain_llm` per generation,
+            if set), and calls rejected with a rate limit error (HTTP 429) are retried after the
+            `RateLimiter` reduces its limits. If 'auto', a `RateLimiter` is sized to the default limits of
+            the provider of `langchain_llm` (see `langfair.generator.rate_limiter.PROVIDER_PROFILES`), if it
+            is recognized. If None, calls are not rate limited by `CounterfactualGenerator`.
+
+        cache_file : str, default=None
+            Path to a JSON Lines file used to cache responses. Prompts previously answered with the same
+            system prompt, model, and temperature (and at least `count` responses) are served from the cache
+            rather than sent to the LLM, and newly generated responses are appended to the file. Responses
+            containing failure messages are not cached. If None, responses are not cached.
+
+        token_cache_file : str, default=None
+            Path to a JSON Lines file used to cache token counts computed by `estimate_token_cost`, keyed
+            by a hash of the encoding name and text. Texts counted in a previous call are not re-tokenized.
+            If None, token counts are not cached.
+
+        dedupe_prompts : bool, default=True
+            Specifies whether identical prompts are dispatched once and share their responses. Set to False
+            to generate independent responses for every occurrence of a prompt.
         """
         super().__init__(
             langchain_llm=langchain_llm,
             suppressed_exceptions=suppressed_exceptions,
             max_calls_per_min=max_calls_per_min,
+            max_concurrent=max_concurrent,
+            rate_limiter=rate_limiter,
+            cache_file=cache_file,
+            token_cache_file=token_cache_file,
+            dedupe_prompts=dedupe_prompts,
         )
         self.use_n_param = use_n_param
         self.attribute_to_word_lists = {
@@ -123,6 +159,7 @@ class CounterfactualGenerator(ResponseGenerator):
         response_sample_size: int = 30,
         system_prompt: str = "You are a helpful assistant",
         count: int = 25,
+        cached_fraction: float = 0,
     ) -> Dict[str, float]:
         """
         Estimates the token cost for a given list of prompts and (optionally) example responses.
@@ -151,22 +188,29 @@ class CounterfactualGenerator(ResponseGenerator):
         count : int, default=25
             The number of generations per prompt used when estimating cost.
 
+        cached_fraction : float, default=0
+            The fraction of prompt tokens expected to be served from the provider's prompt cache and
+            billed at the cached input rate of `tiktoken_model_name`.
+
         Returns
         -------
         dict
-           A dictionary containing the estimated token costs, including prompt token cost, completion token cost,
-           and total token cost.
+           A dictionary containing the estimated token costs, including prompt token cost, cached token cost,
+           completion token cost, and total token cost.
         """
         prompts = list(prompts)
         parse_result = self.parse_texts(texts=prompts, attribute=attribute)
         prompts_sub = [prompts[i] for i in range(len(parse_result)) if parse_result[i]]
-        result = await ResponseGenerator().estimate_token_cost(
+        result = await ResponseGenerator(
+            token_cache_file=self.token_cache_file
+        ).estimate_token_cost(
             tiktoken_model_name=tiktoken_model_name,
             prompts=prompts_sub,
             example_responses=example_responses,
             response_sample_size=response_sample_size,
             system_prompt=system_prompt,
             count=count,
+            cached_fraction=cached_fraction,
         )
         return {
             key: value * len(self.group_mapping[attribute])
@@ -315,6 +359,7 @@ class CounterfactualGenerator(ResponseGenerator):
         system_prompt: str = "You are a helpful assistant.",
         count: int = 25,
         custom_dict: Optional[Dict[str, List[str]]] = None,
+        cacheable_preamble: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Creates prompts by counterfactual substitution and generates responses asynchronously
@@ -339,6 +384,12 @@ class CounterfactualGenerator(ResponseGenerator):
         count: int, default=25
             Specifies number of responses to generate for each prompt.
 
+        cacheable_preamble : str, default=None
+            Optional static instruction block sent as the first system message, ahead of `system_prompt`.
+            Because every request then begins with an identical prefix, providers with automatic prompt
+            caching (e.g. OpenAI and Azure OpenAI, for prefixes of at least 1024 tokens) can serve it from
+            cache at a reduced input token price and latency.
+
         Returns
         ----------
         dict
@@ -364,10 +415,11 @@ class CounterfactualGenerator(ResponseGenerator):
                 'system_prompt' : str
                     The system prompt used for generating responses
         """
-        if self.llm.temperature == 0:
-            assert count == 1, "temperature must be greater than 0 if count > 1"
-        self._update_count(count)
-        self.system_message = SystemMessage(system_prompt)
+        self._prepare_calls(
+            system_prompt=system_prompt,
+            count=count,
+            cacheable_preamble=cacheable_preamble,
+        )
 
         # create counterfactual prompts
         groups = self.group_mapping[attribute] if attribute else custom_dict.keys()
@@ -388,14 +440,9 @@ class CounterfactualGenerator(ResponseGenerator):
             # start = time.time()
             # generate with async
             (
-                tasks,
                 duplicated_prompts_dict[prompt_key],
-            ) = self._create_tasks(prompts=prompts_dict[prompt_key])
-            tmp_response_list = await asyncio.gather(*tasks)
-
-            tmp_responses = []
-            for response in tmp_response_list:
-                tmp_responses.extend(response)
+                tmp_responses,
+            ) = await self._generate_from_prompts(prompts=prompts_dict[prompt_key])
             responses_dict[group + "_response"] = self._enforce_strings(tmp_responses)
             # stop = time.time()
 
@@ -9,19 +9,26 @@
 # prompt and response token counts for OpenAI models.
 
 import asyncio
+import collections
+import contextlib
 import itertools
+import os
 import random
 import warnings
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 
 import langchain_core
 import numpy as np
 import tiktoken
+from langchain_core.messages.base import BaseMessage
 from langchain_core.messages.human import HumanMessage
 from langchain_core.messages.system import SystemMessage
 
 from langfair.constants.cost_data import COST_MAPPING, FAILURE_MESSAGE, TOKEN_COST_DATE
+from langfair.generator.cache import JSONLCache
+from langfair.generator.rate_limiter import RateLimiter
 
+MAX_RATE_LIMIT_RETRIES = 5
 N_PARAM_WARNING = """
 The 'use_n_param' parameter may not be compatible with all BaseChatModel instances. 
 Please ensure that your specific BaseChatModel has an 'n' attribute and supports setting 'n' to a value up to 'count'.
@@ -38,6 +45,11 @@ class ResponseGenerator:
         ] = None,
         use_n_param: bool = False,
         max_calls_per_min: Optional[int] = None,
+        max_concurrent: Optional[int] = None,
+        rate_limiter: Optional[Union[Any, str]] = None,
+        cache_file: Optional[str] = None,
+        token_cache_file: Optional[str] = None,
+        dedupe_prompts: bool = True,
     ) -> None:
         """
         Class for generating data from a provided set of prompts
@@ -59,11 +71,60 @@ class ResponseGenerator:
 
         max_calls_per_min : int, default=None
             [Deprecated] Use LangChain's InMemoryRateLimiter instead.
+
+        max_concurrent : int, default=None
+            Specifies the maximum number of LLM calls in flight at any time. If None, all calls are
+            dispatched at once.
+
+        rate_limiter : RateLimiter, async context manager, or 'auto', default=None
+            An asynchronous rate limiter, such as langfair's `RateLimiter` or `aiolimiter.AsyncLimiter`,
+            that is acquired before each LLM call. If a `RateLimiter` is provided, each call also consumes
+            its estimated token count (prompt tokens plus `max_tokens` of `langchain_llm` per generation,
+            if set), and calls rejected with a rate limit error (HTTP 429) are retried after the
+            `RateLimiter` reduces its limits. If 'auto', a `RateLimiter` is sized to the default limits of
+            the provider of `langchain_llm` (see `langfair.generator.rate_limiter.PROVIDER_PROFILES`), if it
+            is recognized. If None, calls are not rate limited by `ResponseGenerator`.
+
+        cache_file : str, default=None
+            Path to a JSON Lines file used to cache responses. Prompts previously answered with the same
+            system prompt, model, and temperature (and at least `count` responses) are served from the cache
+            rather than sent to the LLM, and newly generated responses are appended to the file. Responses
+            containing failure messages are not cached. If None, responses are not cached.
+
+        token_cache_file : str, default=None
+            Path to a JSON Lines file used to cache token counts computed by `estimate_token_cost`, keyed
+            by a hash of the encoding name and text. Texts counted in a previous call are not re-tokenized.
+            If None, token counts are not cached.
+
+        dedupe_prompts : bool, default=True
+            Specifies whether identical prompts are dispatched once and share their responses. Set to False
+            to generate independent responses for every occurrence of a prompt, e.g. when prompts are
+            repeated to draw more samples.
         """
         self.cost_mapping = COST_MAPPING
         self.token_cost_date = TOKEN_COST_DATE
         self.llm = langchain_llm
         self.use_n_param = use_n_param
+        assert max_concurrent is None or (
+            isinstance(max_concurrent, int) and max_concurrent > 0
+        ), "`max_concurrent` must be a positive integer or None"
+        self.max_concurrent = max_concurrent
+        if isinstance(rate_limiter, str):
+            assert (
+                rate_limiter == "auto"
+            ), "`rate_limiter` must be a rate limiter, 'auto', or None"
+            rate_limiter = RateLimiter.from_llm(langchain_llm)
+            if rate_limiter is None:
+                warnings.warn(
+                    "Could not detect the provider of `langchain_llm`. LLM calls will not be rate limited by ResponseGenerator."
+                )
+        self.rate_limiter = rate_limiter
+        self.cache_file = cache_file
+        self.cache = JSONLCache(cache_file) if cache_file else None
+        self.token_cache_file = token_cache_file
+        self.token_cache = JSONLCache(token_cache_file) if token_cache_file else None
+        self.dedupe_prompts = dedupe_prompts
+        self.token_usage = {"prompt_tokens": 0, "cached_tokens": 0}
         if isinstance(suppressed_exceptions, Dict):
             if self._valid_exceptions(tuple(suppressed_exceptions.keys())):
                 self.suppressed_exceptions = suppressed_exceptions
@@ -89,6 +150,7 @@ class ResponseGenerator:
         response_sample_size: int = 30,
         system_prompt: str = "You are a helpful assistant",
         count: int = 25,
+        cached_fraction: float = 0,
     ) -> Dict[str, float]:
         """
         Estimates the token cost for a given list of prompts and (optionally) example responses.
@@ -115,11 +177,18 @@ class ResponseGenerator:
         count : int, default=25
             The number of generations per prompt used when estimating cost.
 
+        cached_fraction : float, default=0
+            The fraction of prompt tokens expected to be served from the provider's prompt cache and
+            billed at the cached input rate of `tiktoken_model_name`. The fraction observed during the
+            most recent call to `generate_responses` can be computed from `self.token_usage` as
+            `cached_tokens / prompt_tokens`.
+
         Returns
         -------
         dict
-           A dictionary containing the estimated token costs, including prompt token cost, completion token cost,
-           and total token cost.
+           A dictionary containing the estimated token costs, including prompt token cost, cached token cost,
+           completion token cost, and total token cost. The cached token cost is the portion of the
+           prompt token cost billed at the cached input rate.
         """
         # TODO: Add token costs for other models
         # TODO: Scrape rather than hard-code costs.
@@ -129,6 +198,7 @@ class ResponseGenerator:
         assert (
             tiktoken_model_name in self.cost_mapping.keys()
         ), f"Only {list(self.cost_mapping.keys())} are supported"
+        assert 0 <= cached_fraction <= 1, "cached_fraction must be between 0 and 1"
 
         print(f"Estimating cost based on {count} generations per prompt...")
 
@@ -141,27 +211,27 @@ class ResponseGenerator:
             generation = await self.generate_responses(sampled_prompts, count=1)
             example_responses = generation["data"]["response"]
 
-        # Get input token counts
+        # Get input token counts. The system prompt and message overhead are identical for every
+        # prompt, so only the user prompts are encoded, in a single multithreaded batch
+        tokens_per_message, _, encoding = self._token_counting_params(
+            tiktoken_model_name
+        )
+        system_tokens = (
+            2 * tokens_per_message
+            + sum(self._count_tokens(["system", system_prompt, "user"], encoding))
+            + 3  # every reply is primed with <|start|>assistant<|message|>
+        )
         prompt_token_counts = [
-            self._num_tokens_from_messages(
-                [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                model=tiktoken_model_name,
-            )
-            for user_prompt in prompts
+            system_tokens + prompt_tokens
+            for prompt_tokens in self._count_tokens(list(prompts), encoding)
         ]
         total_prompt_tokens = sum(prompt_token_counts) * count
 
         # Estimate output token counts
+        assistant_tokens = len(encoding.encode("assistant")) - 1
         example_response_tokens = [
-            self._num_tokens_from_messages(
-                [{"role": "assistant", "content": response}],
-                model=tiktoken_model_name,
-                prompt=False,
-            )
-            for response in example_responses
+            assistant_tokens + response_tokens
+            for response_tokens in self._count_tokens(list(example_responses), encoding)
         ]
         estimated_total_response_tokens = (
             len(prompts) * np.mean(example_response_tokens) * count
@@ -171,7 +241,13 @@ class ResponseGenerator:
         model_cost = self.cost_mapping.get(
             tiktoken_model_name, {"input": 0, "output": 0}
         )
-        estimated_prompt_token_cost = total_prompt_tokens * model_cost["input"]
+        total_cached_tokens = total_prompt_tokens * cached_fraction
+        estimated_cached_token_cost = total_cached_tokens * model_cost.get(
+            "cached_input", model_cost["input"]
+        )
+        estimated_prompt_token_cost = (
+            total_prompt_tokens - total_cached_tokens
+        ) * model_cost["input"] + estimated_cached_token_cost
         estimated_completion_token_cost = (
             estimated_total_response_tokens * model_cost["output"]
         )
@@ -181,6 +257,7 @@ class ResponseGenerator:
 
         results = {
             "Estimated Prompt Token Cost (USD)": estimated_prompt_token_cost,
+            "Estimated Cached Token Cost (USD)": estimated_cached_token_cost,
             "Estimated Completion Token Cost (USD)": estimated_completion_token_cost,
             "Estimated Total Token Cost (USD)": estimated_total_token_cost,
         }
@@ -191,10 +268,12 @@ class ResponseGenerator:
         prompts: List[str],
         system_prompt: str = "You are a helpful assistant.",
         count: int = 25,
+        cacheable_preamble: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Generates evaluation dataset from a provided set of prompts. For each prompt,
-        `self.count` responses are generated.
+        `self.count` responses are generated. If `dedupe_prompts` is True, identical prompts are
+        dispatched once and share their responses.
 
         Parameters
         ----------
@@ -209,6 +288,12 @@ class ResponseGenerator:
             generations per prompt in evaluating toxicity. See, for example DecodingTrust (https://arxiv.org/abs//2306.11698)
             or Gehman et al., 2020 (https://aclanthology.org/2020.findings-emnlp.301/).
 
+        cacheable_preamble : str, default=None
+            Optional static instruction block sent as the first system message, ahead of `system_prompt`.
+            Because every request then begins with an identical prefix, providers with automatic prompt
+            caching (e.g. OpenAI and Azure OpenAI, for prefixes of at least 1024 tokens) can serve it from
+            cache at a reduced input token price and latency.
+
         Returns
         -------
         dict
@@ -234,6 +319,112 @@ class ResponseGenerator:
                 'system_prompt' : str
                     The system prompt used for generating responses
         """
+        self._setup_generation(
+            prompts=prompts,
+            system_prompt=system_prompt,
+            count=count,
+            cacheable_preamble=cacheable_preamble,
+        )
+
+        duplicated_prompts, responses = await self._generate_from_prompts(
+            prompts=prompts
+        )
+
+        print("Responses successfully generated!")
+        return {
+            "data": {
+                "prompt": self._enforce_strings(duplicated_prompts),
+                "response": self._enforce_strings(responses),
+            },
+            "metadata": {
+                "non_completion_rate": self._calc_noncompletion_rate(responses),
+                "system_prompt": system_prompt,
+                "temperature": self.llm.temperature,
+                "count": self.count,
+            },
+        }
+
+    async def stream_responses(
+        self,
+        prompts: List[str],
+        system_prompt: str = "You are a helpful assistant.",
+        count: int = 25,
+        cacheable_preamble: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, str]]:
+        """
+        Generates responses from a provided set of prompts, yielding each prompt-response pair as
+        soon as its LLM call completes rather than after all calls have finished. Responses are
+        therefore yielded in order of completion, not in the order of `prompts`. Cached responses,
+        if `cache_file` was specified, are yielded first. If `dedupe_prompts` is True, identical prompts
+        are dispatched once and their responses are yielded for each occurrence. Completed calls are
+        buffered only up to `max_concurrent` at a time, so a slow consumer pauses generation rather than
+        letting responses accumulate in memory.
+
+        Parameters
+        ----------
+        prompts : list of strings
+            List of prompts from which LLM responses will be generated
+
+        system_prompt : str or None, default="You are a helpful assistant."
+            Optional argument for user to provide custom system prompt
+
+        count : int, default=25
+            Specifies number of responses to generate for each prompt.
+
+        cacheable_preamble : str, default=None
+            Optional static instruction block sent as the first system message, ahead of `system_prompt`.
+
+        Yields
+        ------
+        dict
+            A dictionary with keys 'prompt' and 'response' for a single generated response.
+        """
+        self._setup_generation(
+            prompts=prompts,
+            system_prompt=system_prompt,
+            count=count,
+            cacheable_preamble=cacheable_preamble,
+        )
+        prompt_counts = collections.Counter(prompts)
+        # number of times each distinct prompt's responses are yielded and generated, respectively
+        repeats, samples = self._prompt_multiplicities(prompt_counts)
+        cached_responses = self._read_cached_responses(samples)
+        for prompt, responses in cached_responses.items():
+            for _ in range(repeats[prompt]):
+                for response in responses:
+                    yield {"prompt": prompt, "response": str(response)}
+
+        uncached_prompts = [
+            prompt
+            for prompt in prompt_counts
+            if prompt not in cached_responses
+            for _ in range(samples[prompt])
+        ]
+        pending_responses = {}
+        parallel_responses = self._run_parallel(prompts=uncached_prompts)
+        try:
+            async for prompt, responses in parallel_responses:
+                for _ in range(repeats[prompt]):
+                    for response in responses:
+                        yield {"prompt": prompt, "response": str(response)}
+                if self.cache is not None:
+                    pending_responses.setdefault(prompt, []).extend(responses)
+                    if len(pending_responses[prompt]) >= self.count * samples[prompt]:
+                        self._write_cached_responses(
+                            {prompt: pending_responses.pop(prompt)}
+                        )
+        finally:
+            # stop outstanding calls as soon as the consumer stops iterating
+            await parallel_responses.aclose()
+
+    def _setup_generation(
+        self,
+        prompts: List[str],
+        system_prompt: str,
+        count: int,
+        cacheable_preamble: Optional[str],
+    ) -> None:
+        """Validates inputs and sets the generation parameters shared by all LLM calls"""
         assert isinstance(
             self.llm, langchain_core.language_models.chat_models.BaseChatModel
         ), """
@@ -249,31 +440,24 @@ class ResponseGenerator:
                 self.use_n_param = False
 
         print(f"Generating {count} responses per prompt...")
+        self._prepare_calls(
+            system_prompt=system_prompt,
+            count=count,
+            cacheable_preamble=cacheable_preamble,
+        )
+
+    def _prepare_calls(
+        self, system_prompt: str, count: int, cacheable_preamble: Optional[str]
+    ) -> None:
+        """Sets the count, system messages, and token usage counters for a new round of LLM calls"""
         if self.llm.temperature == 0:
             assert count == 1, "temperature must be greater than 0 if count > 1"
         self._update_count(count)
-        self.system_message = SystemMessage(system_prompt)
-
-        tasks, duplicated_prompts = self._create_tasks(prompts=prompts)
-        response_lists = await asyncio.gather(*tasks)
-
-        responses = []
-        for response in response_lists:
-            responses.extend(response)
-
-        print("Responses successfully generated!")
-        return {
-            "data": {
-                "prompt": self._enforce_strings(duplicated_prompts),
-                "response": self._enforce_strings(responses),
-            },
-            "metadata": {
-                "non_completion_rate": self._calc_noncompletion_rate(responses),
-                "system_prompt": system_prompt,
-                "temperature": self.llm.temperature,
-                "count": self.count,
-            },
-        }
+        # the cacheable preamble goes first so that it forms a stable prefix for provider prompt caching
+        self.system_messages = (
+            [SystemMessage(cacheable_preamble)] if cacheable_preamble else []
+        ) + [SystemMessage(system_prompt)]
+        self.token_usage = {"prompt_tokens": 0, "cached_tokens": 0}
 
     def _update_count(self, count: int) -> None:
         """Updates self.count parameter and self.llm as necessary"""
@@ -283,38 +467,230 @@ class ResponseGenerator:
         elif hasattr(self.llm, "n"):
             self.llm.n = 1
 
-    def _create_tasks(
-        self,
-        prompts: List[str],
-    ) -> Tuple[List[Any], List[str]]:
+    async def _generate_from_prompts(
+        self, prompts: List[str]
+    ) -> Tuple[List[str], List[Any]]:
         """
-        Creates a list of async tasks and returns duplicated prompt list
-        with each prompt duplicated `count` times
+        Generates `self.count` responses for each prompt, serving prompts found in the response cache
+        from the cache, and returns the duplicated prompt list with the corresponding responses.
+        If `self.dedupe_prompts` is True, identical prompts are dispatched once and share their responses.
         """
+        _, samples = self._prompt_multiplicities(collections.Counter(prompts))
+        cached_responses = self._read_cached_responses(samples)
+        uncached_prompts = [
+            prompt
+            for prompt in samples
+            if prompt not in cached_responses
+            for _ in range(samples[prompt])
+        ]
+        generated_responses = {prompt: [] for prompt in uncached_prompts}
+        async for prompt, responses in self._run_parallel(prompts=uncached_prompts):
+            generated_responses[prompt].extend(responses)
+        self._write_cached_responses(generated_responses)
+
         duplicated_prompts = [
             prompt for prompt, i in itertools.product(prompts, range(self.count))
         ]
-        if self.use_n_param:
+        responses = []
+        # each occurrence of a prompt takes the next `self.count` of its responses, unless deduplicated
+        offsets = collections.Counter()
+        for prompt in prompts:
+            prompt_responses = (
+                cached_responses[prompt]
+                if prompt in cached_responses
+                else generated_responses[prompt]
+            )
+            responses.extend(
+                prompt_responses[offsets[prompt] : offsets[prompt] + self.count]
+            )
+            if not self.dedupe_prompts:
+                offsets[prompt] += self.count
+        return duplicated_prompts, responses
+
+    def _prompt_multiplicities(
+        self, prompt_counts: Dict[str, int]
+    ) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Returns, for each distinct prompt, the number of times its responses are repeated and the number of
+        independent sets of `self.count` responses generated for it
+        """
+        if self.dedupe_prompts:
+            return dict(prompt_counts), dict.fromkeys(prompt_counts, 1)
+        return dict.fromkeys(prompt_counts, 1), dict(prompt_counts)
+
+    def _read_cached_responses(self, samples: Dict[str, int]) -> Dict[str, List[str]]:
+        """
+        Returns `self.count` cached responses per sample for each prompt in `samples`, a mapping of prompts
+        to numbers of samples, with at least that many in the response cache
+        """
+        cached_responses = {}
+        if self.cache is not None:
+            for prompt, n_samples in samples.items():
+                n_responses = self.count * n_samples
+                value = self.cache.get(self._response_cache_key(prompt))
+                if value is not None and len(value) >= n_responses:
+                    cached_responses[prompt] = value[:n_responses]
+            if cached_responses:
+                print(f"Using cached responses for {len(cached_responses)} prompts...")
+        return cached_responses
+
+    def _write_cached_responses(
+        self, generated_responses: Dict[str, List[Any]]
+    ) -> None:
+        """Adds generated responses to the response cache, skipping prompts with failed responses"""
+        if self.cache is None:
+            return
+        failure_messages = {FAILURE_MESSAGE}
+        if isinstance(self.suppressed_exceptions, Dict):
+            failure_messages.update(self.suppressed_exceptions.values())
+        self.cache.update(
+            {
+                self._response_cache_key(prompt): self._enforce_strings(responses)
+                for prompt, responses in generated_responses.items()
+                if not failure_messages.intersection(responses)
+            }
+        )
+
+    def _response_cache_key(self, prompt: str) -> str:
+        """Returns the response cache key for a prompt under the current system prompt, model, and temperature"""
+        model = (
+            getattr(self.llm, "model_name", None)
+            or getattr(self.llm, "deployment_name", None)
+            or type(self.llm).__name__
+        )
+        return JSONLCache.make_key(
+            *(message.content for message in self.system_messages),
+            prompt,
+            model,
+            self.llm.temperature,
+        )
+
+    async def _run_parallel(
+        self, prompts: List[str]
+    ) -> AsyncIterator[Tuple[str, List[Any]]]:
+        """
+        Makes the api calls needed to generate `self.count` responses for each prompt and yields each
+        call's prompt and responses as it completes. Calls are placed on a queue consumed by
+        `self.max_concurrent` workers (one per call if None), each of which waits for rate limiter
+        capacity before making its next call. At most one completed result per worker is buffered
+        for the consumer, so workers pause rather than accumulate results while the consumer is busy.
+        """
+        calls_per_prompt = 1 if self.use_n_param else self.count
+        generations = self.count // calls_per_prompt
+        if isinstance(self.rate_limiter, RateLimiter):
+            call_tokens = self._estimate_call_tokens(
+                prompts=prompts, generations=generations
+            )
+        else:
+            call_tokens = [0] * len(prompts)
+
+        # each prompt's messages are built once and shared by all of its calls
+        calls = asyncio.Queue()
+        for prompt, tokens in zip(prompts, call_tokens):
+            messages = [*self.system_messages, HumanMessage(prompt)]
+            for _ in range(calls_per_prompt):
+                calls.put_nowait((prompt, messages, tokens, 0))
+        n_calls = calls.qsize()
+        if n_calls == 0:
+            return
+
+        n_workers = min(self.max_concurrent or n_calls, n_calls)
+        results = asyncio.Queue(maxsize=n_workers)
+        workers = [
+            asyncio.ensure_future(
+                self._worker(calls=calls, results=results, generations=generations)
+            )
+            for _ in range(n_workers)
+        ]
+        try:
+            for _ in range(n_calls):
+                result = await results.get()
+                if isinstance(result, BaseException):
+                    raise result
+                yield result
+        finally:
+            # cancel outstanding calls if an exception is raised or the consumer stops iterating early
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(
+        self, calls: asyncio.Queue, results: asyncio.Queue, generations: int
+    ) -> None:
+        """
+        Makes queued api calls until the queue is empty. If a `RateLimiter` is used, calls failing
+        with a rate limit error are re-queued after the rate limiter backs off, up to
+        `MAX_RATE_LIMIT_RETRIES` times.
+        """
+        while not calls.empty():
+            prompt, messages, tokens, retries = calls.get_nowait()
             try:
-                tasks = [
-                    self._async_api_call(prompt=prompt, count=self.count)
-                    for prompt in prompts
-                ]
-            except ValueError:
-                self.use_n_param = False
-                self.llm.n = 1
-        if not self.use_n_param:
-            tasks = [
-                self._async_api_call(prompt=prompt, count=1)
-                for prompt in duplicated_prompts
-            ]
-        return tasks, duplicated_prompts
+                async with contextlib.AsyncExitStack() as stack:
+                    if isinstance(self.rate_limiter, RateLimiter):
+                        await self.rate_limiter.aacquire(tokens=tokens)
+                    elif self.rate_limiter is not None:
+                        await stack.enter_async_context(self.rate_limiter)
+                    responses = await self._async_api_call(
+                        prompt=prompt, count=generations, messages=messages
+                    )
+            except Exception as err:
+                if (
+                    isinstance(self.rate_limiter, RateLimiter)
+                    and self._is_rate_limit_error(err)
+                    and retries < MAX_RATE_LIMIT_RETRIES
+                ):
+                    self.rate_limiter.backoff()
+                    calls.put_nowait((prompt, messages, tokens, retries + 1))
+                    continue
+                await results.put(err)
+                return
+            if isinstance(self.rate_limiter, RateLimiter):
+                self.rate_limiter.recover()
+            await results.put((prompt, responses))
+
+    @staticmethod
+    def _is_rate_limit_error(err: BaseException) -> bool:
+        """Returns true if an exception indicates the provider's rate limit was exceeded (HTTP 429)"""
+        response = getattr(err, "response", None)
+        return (
+            getattr(err, "status_code", None) == 429
+            or getattr(response, "status_code", None) == 429
+            or type(err).__name__ == "RateLimitError"
+        )
+
+    def _estimate_call_tokens(self, prompts: List[str], generations: int) -> List[int]:
+        """
+        Estimates the tokens consumed by a single api call for each prompt: system and user prompt
+        tokens plus the `max_tokens` of `self.llm` for each generation, if set
+        """
+        try:
+            encoding = tiktoken.encoding_for_model(
+                getattr(self.llm, "model_name", None) or ""
+            )
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        system_tokens = sum(
+            len(encoding.encode(message.content, disallowed_special=()))
+            for message in self.system_messages
+        )
+        completion_tokens = generations * (getattr(self.llm, "max_tokens", None) or 0)
+        return [
+            system_tokens + len(prompt_tokens) + completion_tokens
+            for prompt_tokens in encoding.encode_batch(prompts, disallowed_special=())
+        ]
 
-    async def _async_api_call(self, prompt: str, count: int = 1) -> List[Any]:
-        """Generates responses asynchronously using a BaseLanguageModel object"""
-        messages = [self.system_message, HumanMessage(prompt)]
+    async def _async_api_call(
+        self, prompt: str, count: int = 1, messages: Optional[List[BaseMessage]] = None
+    ) -> List[Any]:
+        """
+        Generates responses asynchronously using a BaseLanguageModel object. `messages` may be
+        provided to reuse the message list already built for `prompt`.
+        """
+        if messages is None:
+            messages = [*self.system_messages, HumanMessage(prompt)]
         try:
             result = await self.llm.agenerate([messages])
+            self._record_token_usage(result)
             generations = [result.generations[0][i].text for i in range(count)]
             if len(generations) != count:
                 raise ValueError("Incorrect number of generations")
@@ -328,6 +704,15 @@ class ResponseGenerator:
                     return [FAILURE_MESSAGE] * count
             raise err
 
+    def _record_token_usage(self, result: Any) -> None:
+        """Accumulates the prompt and cached prompt token counts reported by the provider, if available"""
+        message = getattr(result.generations[0][0], "message", None)
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.token_usage["prompt_tokens"] += usage.get("input_tokens", 0)
+        self.token_usage["cached_tokens"] += usage.get("input_token_details", {}).get(
+            "cache_read", 0
+        )
+
     def _calc_noncompletion_rate(self, responses: List[str]) -> float:
         """Compute noncompletion rate"""
         if isinstance(self.suppressed_exceptions, Dict):
@@ -370,12 +755,41 @@ class ResponseGenerator:
         """Enforce that all outputs are strings"""
         return [str(r) for r in texts]
 
+    def _count_tokens(self, texts: List[str], encoding: tiktoken.Encoding) -> List[int]:
+        """
+        Returns the token count of each text, tokenizing in a single multithreaded batch. If a token
+        cache is specified, only texts missing from the cache are tokenized.
+        """
+        num_threads = os.cpu_count() or 1
+        if self.token_cache is None:
+            return [
+                len(tokens)
+                for tokens in encoding.encode_batch(texts, num_threads=num_threads)
+            ]
+        keys = [
+            JSONLCache.make_key(encoding.name, text, digest_size=8) for text in texts
+        ]
+        missing = {
+            key: text for key, text in zip(keys, texts) if key not in self.token_cache
+        }
+        if missing:
+            self.token_cache.update(
+                {
+                    key: len(tokens)
+                    for key, tokens in zip(
+                        missing,
+                        encoding.encode_batch(
+                            list(missing.values()), num_threads=num_threads
+                        ),
+                    )
+                }
+            )
+        return [self.token_cache.get(key) for key in keys]
+
     @staticmethod
-    def _num_tokens_from_messages(
-        messages: List[Dict[str, str]], model: str, prompt: bool = True
-    ) -> int:
+    def _token_counting_params(model: str) -> Tuple[int, int, tiktoken.Encoding]:
         """
-        Returns the number of tokens used by a list of messages.
+        Returns the per-message token overhead, per-name token overhead, and encoding for a model.
 
         Note : This code is adapted from the `openai-cookbook` GitHub repository.
         Source: https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
@@ -388,6 +802,10 @@ class ResponseGenerator:
             "gpt-4-32k-0314": (3, 1),
             "gpt-4-0613": (3, 1),
             "gpt-4-32k-0613": (3, 1),
+            "gpt-4o": (3, 1),
+            "gpt-4o-2024-08-06": (3, 1),
+            "gpt-4o-mini": (3, 1),
+            "gpt-4o-mini-2024-07-18": (3, 1),
         }
         if model not in model_data:
             if "gpt-3.5-turbo" in model:
@@ -410,16 +828,4 @@ class ResponseGenerator:
         except KeyError:
             print("Warning: model not found. Using cl100k_base encoding.")
             encoding = tiktoken.get_encoding("cl100k_base")
-        num_tokens = 0
-        for message in messages:
-            if prompt:
-                num_tokens += tokens_per_message
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-        if prompt:
-            num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-        elif not prompt:
-            num_tokens += -1
-        return num_tokens
+        return tokens_per_message, tokens_per_name, encoding
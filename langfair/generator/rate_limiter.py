@@ -0,0 +1,228 @@
+# Copyright 2024 CVS Health and/or one of its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+from typing import Any, Optional
+
+# Lower bound on the fraction of the configured limits enforced after repeated backoffs
+MIN_SCALE = 1 / 64
+# Fraction of the configured limits restored after each successful request
+RECOVERY_STEP = 0.01
+# Minimum number of seconds after a backoff during which further rate limit errors are attributed to the
+# same burst of requests and do not reduce the limits again
+MIN_BACKOFF_WINDOW = 1.0
+# Conservative default (requests per minute, tokens per minute) limits of common LLM providers, used to
+# size a RateLimiter when the actual limits of a deployment are not known
+PROVIDER_PROFILES = {
+    "azure": (60, 120_000),
+    "openai": (60, 150_000),
+    "anthropic": (50, 40_000),
+}
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        start_full: bool = True,
+    ) -> None:
+        """
+        Token-bucket rate limiter enforcing requests-per-minute and tokens-per-minute limits
+        simultaneously. Each bucket holds up to one minute's worth of capacity and refills
+        continuously at its per-minute rate, so short prompts do not waste token quota and long
+        prompts do not overrun it.
+
+        If the provider still rejects requests for exceeding its rate limit, `backoff` halves the
+        effective limits (multiplicative decrease) and each subsequent successful request, reported
+        with `recover`, restores a small share of them (additive increase) until the configured
+        limits are reached again. The limits are halved at most once per backoff window, so a burst
+        of concurrent requests rejected together reduces them only once.
+
+        Parameters
+        ----------
+        requests_per_minute : int, default=None
+            Maximum number of requests per minute. If None, requests are not limited.
+
+        tokens_per_minute : int, default=None
+            Maximum number of tokens (prompt plus expected completion) per minute. If None,
+            tokens are not limited.
+
+        start_full : bool, default=True
+            Specifies whether the buckets start full, admitting a burst of up to one minute's worth
+            of requests at once. If False, the buckets start empty and requests are paced at the
+            configured rates from the start, which avoids tripping providers that enforce their
+            per-minute limits over shorter windows.
+        """
+        assert (
+            requests_per_minute or tokens_per_minute
+        ), "At least one of `requests_per_minute` or `tokens_per_minute` must be specified"
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_capacity = float(requests_per_minute or 0) if start_full else 0.0
+        self._token_capacity = float(tokens_per_minute or 0) if start_full else 0.0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._scale = 1.0
+        self._backoff_until = float("-inf")
+
+    def acquire(self, tokens: int = 0) -> None:
+        """
+        Blocks until capacity for one request consuming `tokens` tokens is available.
+
+        Parameters
+        ----------
+        tokens : int, default=0
+            Number of tokens the request is expected to consume.
+        """
+        while True:
+            wait_time = self._try_acquire(tokens)
+            if wait_time == 0:
+                return
+            time.sleep(wait_time)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """
+        Waits asynchronously until capacity for one request consuming `tokens` tokens is available.
+
+        Parameters
+        ----------
+        tokens : int, default=0
+            Number of tokens the request is expected to consume.
+        """
+        while True:
+            wait_time = self._try_acquire(tokens)
+            if wait_time == 0:
+                return
+            await asyncio.sleep(wait_time)
+
+    def backoff(self) -> None:
+        """
+        Halves the effective limits and empties both buckets after a rate limit error. Further calls are
+        ignored until the emptied request bucket admits a request at the reduced limits (at least
+        `MIN_BACKOFF_WINDOW` seconds), since errors within that window come from requests admitted before
+        the limits were reduced.
+        """
+        with self._lock:
+            self._refill()
+            if self._last_refill < self._backoff_until:
+                return
+            self._scale = max(self._scale / 2, MIN_SCALE)
+            self._request_capacity = 0.0
+            self._token_capacity = 0.0
+            backoff_window = MIN_BACKOFF_WINDOW
+            if self.requests_per_minute:
+                backoff_window = max(
+                    backoff_window, 60 / (self.requests_per_minute * self._scale)
+                )
+            self._backoff_until = self._last_refill + backoff_window
+
+    def recover(self) -> None:
+        """Raises the effective limits by a small step, up to the configured limits, after a successful request"""
+        with self._lock:
+            self._scale = min(self._scale + RECOVERY_STEP, 1.0)
+
+    @classmethod
+    def from_llm(cls, llm: Any) -> Optional["RateLimiter"]:
+        """
+        Creates a rate limiter sized to the default limits in `PROVIDER_PROFILES` of the provider serving
+        `llm`, detected from its class name or API base URL. Returns None if the provider is not recognized.
+        Since the actual limits are not known, the buckets start empty so that requests are paced from the
+        start rather than sent in a burst.
+
+        Parameters
+        ----------
+        llm : langchain `BaseChatModel`
+            The LLM whose calls will be rate limited.
+        """
+        provider = cls._detect_provider(llm)
+        if provider is None:
+            return None
+        requests_per_minute, tokens_per_minute = PROVIDER_PROFILES[provider]
+        return cls(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            start_full=False,
+        )
+
+    @staticmethod
+    def _detect_provider(llm: Any) -> Optional[str]:
+        """Returns the `PROVIDER_PROFILES` key of the provider serving `llm`, or None if it is not recognized"""
+        class_name = type(llm).__name__.lower()
+        api_base = str(getattr(llm, "openai_api_base", None) or "").lower()
+        if "azure" in class_name or "azure" in api_base:
+            return "azure"
+        for provider in PROVIDER_PROFILES:
+            if provider in class_name:
+                return provider
+        return None
+
+    async def __aenter__(self) -> "RateLimiter":
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def _refill(self) -> None:
+        """Adds capacity accrued since the last refill, up to one minute's worth"""
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            requests_per_minute = self.requests_per_minute * self._scale
+            self._request_capacity = min(
+                requests_per_minute,
+                self._request_capacity + elapsed * requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            tokens_per_minute = self.tokens_per_minute * self._scale
+            self._token_capacity = min(
+                tokens_per_minute,
+                self._token_capacity + elapsed * tokens_per_minute / 60,
+            )
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Consumes capacity if available and returns 0, otherwise returns the number of seconds to wait"""
+        with self._lock:
+            self._refill()
+            wait_time = 0.0
+            # a request costs less than one unit of capacity only when the reduced limits allow fewer
+            # than one request per minute, since it would otherwise never be admitted
+            requests = 1.0
+            if self.requests_per_minute:
+                requests_per_minute = self.requests_per_minute * self._scale
+                requests = min(requests, requests_per_minute)
+                if self._request_capacity < requests:
+                    wait_time = (
+                        (requests - self._request_capacity) * 60 / requests_per_minute
+                    )
+            if self.tokens_per_minute:
+                tokens_per_minute = self.tokens_per_minute * self._scale
+                # a request larger than the bucket would otherwise never be admitted
+                tokens = min(tokens, tokens_per_minute)
+                if self._token_capacity < tokens:
+                    wait_time = max(
+                        wait_time,
+                        (tokens - self._token_capacity) * 60 / tokens_per_minute,
+                    )
+            if wait_time > 0:
+                return wait_time
+            if self.requests_per_minute:
+                self._request_capacity -= requests
+            if self.tokens_per_minute:
+                self._token_capacity -= tokens
+            return 0.0
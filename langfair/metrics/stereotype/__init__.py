@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from langfair.metrics.stereotype.corpus import TokenizedCorpus
 from langfair.metrics.stereotype.stereotype import StereotypeMetrics
 
-__all__ = ["StereotypeMetrics"]
+__all__ = ["StereotypeMetrics", "TokenizedCorpus"]
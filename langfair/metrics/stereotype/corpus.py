@@ -0,0 +1,96 @@
+# Copyright 2024 CVS Health and/or one of its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from typing import Dict, List, Optional
+
+import numpy as np
+from nltk.tokenize import word_tokenize
+
+
+class TokenizedCorpus:
+    def __init__(self, responses: List[str], n_jobs: Optional[int] = 1) -> None:
+        """
+        Lowercased and word-tokenized view of a list of responses, shared by the stereotype
+        metrics so that the responses are normalized and tokenized only once. Tokens are also
+        encoded as integer ids over a shared vocabulary. Each view is computed on first access
+        and reused afterwards.
+
+        Parameters
+        ----------
+        responses : list of strings
+            A list of generated outputs from a language model.
+
+        n_jobs : int, default=1
+            Number of worker processes used to tokenize the responses. If None or -1, one process
+            per CPU is used. Worth raising only for large corpora, as starting the processes and
+            transferring the responses to them has a fixed cost.
+        """
+        assert (
+            n_jobs is None or n_jobs == -1 or n_jobs >= 1
+        ), "`n_jobs` must be a positive integer, -1, or None"
+        self.responses = list(responses)
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs in (None, -1) else n_jobs
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    @cached_property
+    def lower_texts(self) -> List[str]:
+        """Lowercased responses"""
+        return [response.lower() for response in self.responses]
+
+    @cached_property
+    def tokens(self) -> List[List[str]]:
+        """Word tokens of each lowercased response"""
+        if self.n_jobs == 1 or len(self.responses) < 2:
+            return [word_tokenize(text) for text in self.lower_texts]
+        # Responses are tokenized independently, so split them into a few chunks per process
+        chunksize = max(1, len(self.responses) // (4 * self.n_jobs))
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+            return list(
+                executor.map(word_tokenize, self.lower_texts, chunksize=chunksize)
+            )
+
+    @cached_property
+    def vocab(self) -> Dict[str, int]:
+        """Id of every distinct token, in order of first occurrence"""
+        return {
+            token: i
+            for i, token in enumerate(dict.fromkeys(itertools.chain(*self.tokens)))
+        }
+
+    @cached_property
+    def token_ids(self) -> np.ndarray:
+        """Vocabulary id of every token of every response, in corpus order"""
+        return np.fromiter(
+            (self.vocab[token] for token in itertools.chain(*self.tokens)),
+            dtype=np.int32,
+            count=int(self.doc_lengths.sum()),
+        )
+
+    @cached_property
+    def doc_ids(self) -> np.ndarray:
+        """Index of the response that each token in `token_ids` belongs to"""
+        return np.repeat(np.arange(len(self.tokens), dtype=np.int32), self.doc_lengths)
+
+    @cached_property
+    def doc_lengths(self) -> np.ndarray:
+        """Number of tokens in each response"""
+        return np.fromiter(
+            map(len, self.tokens), dtype=np.int64, count=len(self.tokens)
+        )
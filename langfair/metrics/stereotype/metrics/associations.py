@@ -18,8 +18,7 @@
 # to remove demographic representations metric and refactor for compatibility
 # with LangFair.
 
-import itertools
-from collections import defaultdict
+from collections import Counter, defaultdict
 from typing import Dict, List, Optional, Tuple
 
 import nltk
@@ -31,6 +30,7 @@ from langfair.constants.word_lists import (
     GENDER_TO_WORD_LISTS,
     PROFESSION_LIST,
 )
+from langfair.metrics.stereotype.corpus import TokenizedCorpus
 
 # Target categories
 TARGET_CATEGORY_TO_WORD_LIST = {
@@ -116,7 +116,9 @@ class StereotypicalAssociations:
         except LookupError:
             nltk.download("punkt_tab")
 
-    def evaluate(self, responses: List[str]) -> Optional[float]:
+    def evaluate(
+        self, responses: List[str], corpus: Optional[TokenizedCorpus] = None
+    ) -> Optional[float]:
         """
         Compute the mean stereotypical association bias of the target words and demographic groups.
 
@@ -135,29 +137,47 @@ class StereotypicalAssociations:
             A list of generated outputs from a language model on which Stereotypical Associations
             metric will be calculated.
 
+        corpus : TokenizedCorpus, default=None
+            Tokenized view of `responses` shared with other stereotype metrics. If None, the
+            responses are tokenized here.
+
         Returns
         -------
         float
             Stereotypical associations score
         """
         # Count the number of times each target_word and group co-occur
+        if corpus is None:
+            corpus = TokenizedCorpus(responses)
+        # A target word listed more than once contributes once per listing
+        target_word_counts = Counter(self.target_words)
+        target_words = [w for w in target_word_counts if w in corpus.vocab]
+        target_index = np.full(len(corpus.vocab), -1, dtype=np.int64)
+        target_index[[corpus.vocab[w] for w in target_words]] = np.arange(
+            len(target_words)
+        )
+        token_targets = target_index[corpus.token_ids]
+        is_target = token_targets >= 0
         pair_to_count: Dict[Tuple[str, str], int] = defaultdict(int)
-        for response in responses:
-            tokens = word_tokenize(response.lower())
-            for target_word, group in itertools.product(
-                self.target_words, self.demographic_groups
-            ):
-                group_words = self.demographic_group_to_words[group]
-                num_group_tokens = sum(
-                    [tokens.count(w) for w in group_words]
-                )  # e.g. number of time asian words occur
-                num_target_tokens = tokens.count(
-                    target_word
-                )  # e.g. number of tokens that are in the adj list
-                count = (
-                    num_group_tokens * num_target_tokens
-                )  # e.g. number of times an asian word co-occur with an adj
-                pair_to_count[(target_word, group)] += count
+        for group in self.demographic_groups:
+            group_word_counts = np.zeros(len(corpus.vocab))
+            for w in self.demographic_group_to_words[group]:
+                if w in corpus.vocab:
+                    group_word_counts[corpus.vocab[w]] += 1
+            num_group_tokens = np.bincount(
+                corpus.doc_ids,
+                weights=group_word_counts[corpus.token_ids],
+                minlength=len(corpus),
+            )  # e.g. number of time asian words occur in each response
+            counts = np.bincount(
+                token_targets[is_target],
+                weights=num_group_tokens[corpus.doc_ids[is_target]],
+                minlength=len(target_words),
+            )  # e.g. number of times an asian word co-occur with an adj
+            for target_word, count in zip(target_words, counts):
+                pair_to_count[(target_word, group)] += (
+                    int(count) * target_word_counts[target_word]
+                )
 
         # Compute a bias score for each target word
         bias_scores = [
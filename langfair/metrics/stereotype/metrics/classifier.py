@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Any, Dict, List, Optional, Union
+import itertools
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
 
 from transformers import pipeline
 
@@ -30,6 +31,9 @@ DefaultMetricObjects = {
 }
 DefaultMetricNames = list(DefaultMetricObjects.keys())
 AvailableCategories = ["gender", "race", "profession", "religion"]
+# Number of texts padded together in each forward pass of the classifier. Memory grows with the square of
+# the padded length in every attention layer, so this is kept well below `batch_size`.
+PIPELINE_BATCH_SIZE = 16
 
 
 class StereotypeClassifier:
@@ -39,6 +43,8 @@ class StereotypeClassifier:
         categories: List[str] = ["Race", "Gender"],
         threshold: float = 0.5,
         batch_size: int = 250,
+        device: str = "cpu",
+        quantize: bool = False,
         _classifier_model: str = "wu981526092/Sentence-Level-Stereotype-Detector",
     ) -> None:
         """
@@ -60,11 +66,24 @@ class StereotypeClassifier:
 
         batch_size : int, default=250
             Specifies the batch size for scoring stereotype of texts. Avoid setting too large to prevent the kernel from dying.
+            Texts are sorted by length before batching, and each batch is scored in forward passes of
+            `PIPELINE_BATCH_SIZE` texts padded to similar lengths.
+
+        device: str or torch.device input or torch.device object, default="cpu"
+            Specifies the device that the classifier uses for prediction. Set to "cuda" for the classifier to be able to
+            leverage the GPU, in which case the classifier runs in half precision.
+
+        quantize : bool, default=False
+            Specifies whether to quantize the classifier's linear layers to int8 for faster CPU inference with
+            a smaller memory footprint. Scores may differ slightly from those of the full-precision classifier.
+            Only supported on CPU.
         """
         self._validate_categories(categories=categories)
         self.categories = categories
         self.threshold = threshold
         self.batch_size = batch_size
+        self.device = device
+        self.quantize = quantize
         self.name = "Stereotype Classifier"
 
         self.metrics = metrics
@@ -79,24 +98,61 @@ class StereotypeClassifier:
             model=self._classifier_model,
             tokenizer=self._classifier_model,
             truncation=True,
+            device=self.device,
         )
+        if self.classifier_instance.device.type == "cuda":
+            self.classifier_instance.model.half()
+        if self.quantize:
+            assert (
+                self.classifier_instance.device.type == "cpu"
+            ), "Quantization is only supported on CPU"
+            import torch
+
+            self.classifier_instance.model = torch.ao.quantization.quantize_dynamic(
+                self.classifier_instance.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
 
-    def get_stereotype_scores(self, responses: List[str]) -> Dict[str, Any]:
+    def get_stereotype_scores(self, responses: Iterable[str]) -> Dict[str, Any]:
         """
         Calculate stereotype scores for a list of outputs.
 
         Parameters
         ----------
-        responses : list of strings
-            A list of generated outputs from a language model on which classifier-based
-            stereotype metrics will be calculated.
+        responses : iterable of strings
+            Generated outputs from a language model on which classifier-based stereotype metrics will be
+            calculated. Responses are consumed `batch_size` at a time, so a generator can be passed to avoid
+            materializing all responses before scoring. Lists are scored in order of decreasing length to
+            minimize padding within each batch.
 
         Returns
         -------
         dict
             Dictionary containing response-level stereotype scores returned by stereotype classifier
         """
-        score_dicts = self.classifier_instance(responses)
+        if isinstance(responses, Sequence):
+            # Score texts in order of decreasing length to minimize padding within each batch
+            order = sorted(
+                range(len(responses)), key=lambda i: len(responses[i]), reverse=True
+            )
+            texts = (responses[i] for i in order)
+            scored_responses = list(responses)
+        else:
+            order, texts = None, iter(responses)
+            scored_responses = []
+        score_dicts = []
+        batch = list(itertools.islice(texts, self.batch_size))
+        while batch:
+            if order is None:
+                scored_responses.extend(batch)
+            score_dicts.extend(
+                self.classifier_instance(batch, batch_size=PIPELINE_BATCH_SIZE)
+            )
+            batch = list(itertools.islice(texts, self.batch_size))
+        if order is not None:
+            # Restore the original order of the responses
+            sorted_score_dicts, score_dicts = score_dicts, [None] * len(order)
+            for i, score_dict in zip(order, sorted_score_dicts):
+                score_dicts[i] = score_dict
         stereotype_scores = {
             key: [d[key] for d in score_dicts] for key in score_dicts[0]
         }
@@ -104,7 +160,7 @@ class StereotypeClassifier:
         data = {
             "stereotype_score_" + category.lower(): [] for category in self.categories
         }
-        data["response"] = responses
+        data["response"] = scored_responses
         for score, label in zip(stereotype_scores["score"], stereotype_scores["label"]):
             for category in self.categories:
                 data["stereotype_score_" + category.lower()].append(
@@ -114,8 +170,8 @@ class StereotypeClassifier:
 
     def evaluate(
         self,
-        responses: List[str],
-        scores: Optional[List[float]] = None,
+        responses: Iterable[str],
+        scores: Optional[Dict[str, List[Any]]] = None,
         prompts: Optional[List[str]] = None,
         return_data: bool = False,
         categories: List[str] = ["gender", "race"],
@@ -125,11 +181,13 @@ class StereotypeClassifier:
 
         Parameters
         ----------
-        responses : list of strings
-            A list of generated output from an LLM.
+        responses : iterable of strings
+            Generated outputs from an LLM. Consumed `batch_size` at a time when computing stereotype scores.
 
-        scores : list of float, default=None
-            A list response-level stereotype score. If None, method will compute it first.
+        scores : dict, default=None
+            Response-level stereotype scores for `responses`, as returned in 'data' by a previous call with
+            `return_data=True` or by `get_stereotype_scores`. Must contain scores for each of `categories`.
+            If None, method will compute them first.
 
         prompts : list of strings, default=None
             A list of prompts from which `responses` were generated. If provided, metrics should be calculated by prompt
@@ -150,6 +208,8 @@ class StereotypeClassifier:
         if not scores:
             print("Computing stereotype scores...")
             evaluation_data = self.get_stereotype_scores(responses)
+        else:
+            evaluation_data = dict(scores)
 
         print("Evaluating metrics...")
         result = {}
@@ -12,21 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import itertools
 import math
 import re
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 import nltk
 import numpy as np
 from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 
 from langfair.constants.word_lists import (
     ADJECTIVE_LIST,
     GENDER_TO_WORD_LISTS,
     PROFESSION_LIST,
 )
+from langfair.metrics.stereotype.corpus import TokenizedCorpus
 
 # Ensuring that nltk library can access the nltk_data in 'resources' directory
 try:
@@ -35,6 +34,16 @@ except LookupError:
     nltk.download("stopwords")
 stop_words = set(stopwords.words("english"))
 
+DIGITS_PATTERN = re.compile(r"\d+")
+EDGE_PUNCTUATION_PATTERN = re.compile(r"^[^A-Za-z<>$]+|[^A-Za-z<>$]+$")
+# ASCII characters matched by EDGE_PUNCTUATION_PATTERN, for stripping ASCII tokens without a regex
+ASCII_EDGE_PUNCTUATION = "".join(
+    c for c in map(chr, range(128)) if EDGE_PUNCTUATION_PATTERN.fullmatch(c)
+)
+# Maximum number of (reference word, attribute word) occurrence pairs weighted at once, which bounds the
+# memory used to accumulate cooccurrences regardless of the size of the corpus
+MAX_PAIRS_PER_BLOCK = 2_000_000
+
 
 class CooccurrenceBiasMetric:
     def __init__(
@@ -109,11 +118,22 @@ class CooccurrenceBiasMetric:
             )
 
         self.protected_nouns = self.group1_nouns | self.group2_nouns
+        # Bit flags of each excluded (stop or protected) word: 1 if in group1, 2 if in group2, 4 if a stop word.
+        # Reference words are the words without flags.
+        self._word_flags = {
+            word: (word in self.group1_nouns)
+            | (word in self.group2_nouns) << 1
+            | (word in stop_words) << 2
+            for word in stop_words | self.protected_nouns
+        }
         self.beta = beta
         self.how = how
         self.name = "Cooccurrence Bias"
+        self.word_level_scores = None
 
-    def evaluate(self, responses: List[str]) -> Union[float, Dict[str, float]]:
+    def evaluate(
+        self, responses: List[str], corpus: Optional[TokenizedCorpus] = None
+    ) -> Union[float, Dict[str, float]]:
         """
         Compute the relative co-occurrence rates of target words with
         protected attribute words.
@@ -124,18 +144,27 @@ class CooccurrenceBiasMetric:
             A list of generated outputs from a language model on which co-occurrence bias score
             metric will be calculated.
 
+        corpus : TokenizedCorpus, default=None
+            Tokenized view of `responses` shared with other stereotype metrics. If None, the
+            responses are tokenized here.
+
         Returns
         -------
         float
-            Co-occurrence bias score metric
+            Co-occurrence bias score metric. Regardless of `how`, the COBS(w) of each word 'w' is
+            also stored in the `word_level_scores` attribute.
 
         References
         ----------
         .. footbibliography::
         """
+        self.word_level_scores = None
+
         # Conduct intermediate operations before COBS calculations
-        tot_co_counts, tot_cooccur, reference_words, all_words, attribute_word_lists = (
-            self._prep_lists(responses)
+        tot_co_counts, tot_cooccur, n_reference_words, all_words, attribute_counts = (
+            self._prep_lists(
+                corpus if corpus is not None else TokenizedCorpus(responses)
+            )
         )
 
         if not all_words:
@@ -157,7 +186,7 @@ class CooccurrenceBiasMetric:
                     for g in ["group1", "group2"]
                 )
                 group1_denominator, group2_denominator = (
-                    len(attribute_word_lists[g]) / len(reference_words)
+                    attribute_counts[g] / n_reference_words
                     for g in ["group1", "group2"]
                 )
                 cobs_scores[target_word] = abs(
@@ -174,116 +203,149 @@ class CooccurrenceBiasMetric:
                 "None of the target words co-occur with both lists of attribute words. Unable to calculate COBS score."
             )
             return None
+        self.word_level_scores = cobs_scores
 
         # Return either average COBS score or dictinary with COBS(w) for each w
         return np.mean(cobs_scores_list) if self.how == "mean" else cobs_scores
 
     def _prep_lists(
-        self, responses: List[str]
-    ) -> Tuple[List[str], List[str], List[str], List[str], List[str]]:
+        self, corpus: TokenizedCorpus
+    ) -> Tuple[
+        Dict[str, Dict[str, float]], Dict[str, float], int, Set[str], Dict[str, int]
+    ]:
         """
-        Create lists for COBS(w) calculation from list of responses.
+        Compute cooccurrence totals and word counts for COBS(w) calculation from tokenized corpus of responses.
         """
-        # Tokenize sentences, get list of all words, and get set of non-protected, non-stop words
-        tokenized_texts = [self._get_clean_token_list(t) for t in responses]
-        all_words = list(itertools.chain(*tokenized_texts))
-        reference_words = [
-            word
-            for word in all_words
-            if word not in stop_words.union(self.protected_nouns)
-        ]
-
-        # Get list of both sets of protected attribute words contained in text corpus
-        attribute_word_lists = {}
-        attribute_word_lists["group1"] = [
-            word for word in all_words if word in self.group1_nouns
-        ]
-        attribute_word_lists["group2"] = [
-            word for word in all_words if word in self.group2_nouns
-        ]
-        if not (
-            (len(attribute_word_lists["group1"]) > 0)
-            and (len(attribute_word_lists["group2"]) > 0)
-        ):
+        # Clean each distinct token once and map corpus token ids to ids of clean words, dropping tokens
+        # that are empty after cleaning
+        clean_tokens = [self._transform_token(token) for token in corpus.vocab]
+        vocab = {
+            word: i for i, word in enumerate(dict.fromkeys(filter(None, clean_tokens)))
+        }
+        clean_ids = np.fromiter(
+            (vocab.get(token, -1) for token in clean_tokens),
+            dtype=np.int64,
+            count=len(clean_tokens),
+        )
+        word_ids = clean_ids[corpus.token_ids]
+        is_kept = word_ids >= 0
+        word_ids, doc_ids = word_ids[is_kept], corpus.doc_ids[is_kept]
+
+        # Flag both sets of protected attribute words and non-protected, non-stop words in the vocabulary
+        # with a single lookup per word
+        word_flags = np.fromiter(
+            (self._word_flags.get(word, 0) for word in vocab),
+            dtype=np.int8,
+            count=len(vocab),
+        )[word_ids]
+        is_attribute = {
+            "group1": (word_flags & 1) > 0,
+            "group2": (word_flags & 2) > 0,
+        }
+        is_reference = word_flags == 0
+        attribute_counts = {g: int(mask.sum()) for g, mask in is_attribute.items()}
+        if not ((attribute_counts["group1"] > 0) and (attribute_counts["group2"] > 0)):
             print(
                 "The provided sentences do not contain words from both word lists. Unable to calculate Co-occurrence bias score."
             )
             return None, None, None, None, None
-        tot_co_counts = {}
-        for text in tokenized_texts:
-            # Get procted attribute cooccurrence counts for current sentence
-            co_counts = self._calculate_cooccurrence_scores(text, self.beta)
-
-            # Get cumulative protected attribute cooccurrence counts
-            tot_co_counts = {
-                word: {
-                    "group1": co_counts.get(word, {"group1": 0, "group2": 0})["group1"]
-                    + tot_co_counts.get(word, {"group1": 0, "group2": 0})["group1"],
-                    "group2": co_counts.get(word, {"group1": 0, "group2": 0})["group2"]
-                    + tot_co_counts.get(word, {"group1": 0, "group2": 0})["group2"],
-                }
-                for word in set(co_counts) | set(tot_co_counts)
-            }
+
+        # Locate every word by its position within its response
+        doc_lengths = np.bincount(doc_ids, minlength=len(corpus))
+        positions = np.arange(len(word_ids)) - np.repeat(
+            np.cumsum(doc_lengths) - doc_lengths, doc_lengths
+        )
+        # Lookup table of beta ** d for every token distance d that can occur within a response
+        beta_powers = np.power(
+            self.beta, np.arange(doc_lengths.max(), dtype=np.float64)
+        )
+
+        # Sum protected attribute cooccurrence weights of every reference word across the corpus
+        group_totals = {
+            g: self._accumulate_cooccurrences(
+                word_ids[is_reference],
+                doc_ids[is_reference],
+                positions[is_reference],
+                doc_ids[mask],
+                positions[mask],
+                beta_powers,
+                len(vocab),
+            )
+            for g, mask in is_attribute.items()
+        }
+        tot_co_counts = {
+            word: {g: float(group_totals[g][i]) for g in group_totals}
+            for word, i in vocab.items()
+        }
 
         # Get total cooccurrence counts for all words for COBS calculation
-        tot_cooccur = {"group1": 0, "group2": 0}
-        for word in set(reference_words):
-            for g in ["group1", "group2"]:
-                tot_cooccur[g] += tot_co_counts[word][g]
+        tot_cooccur = {g: float(totals.sum()) for g, totals in group_totals.items()}
 
         return (
             tot_co_counts,
             tot_cooccur,
-            reference_words,
-            all_words,
-            attribute_word_lists,
+            int(is_reference.sum()),
+            vocab.keys(),
+            attribute_counts,
         )
 
-    def _calculate_cooccurrence_scores(
-        self, response: str, beta: float
-    ) -> Dict[str, float]:
-        """
-        Gets cooccurrences of each word in a text corpus with protected attribute words. Returns a dictionary
-        indicating group word cooccurrences for each target word.
-        """
-        cooccurence_scores = {}
-        response_words = list(enumerate(response))
-        for ref_pos, ref_word in response_words:
-            if ref_word not in stop_words.union(self.protected_nouns):
-                if ref_word not in cooccurence_scores:
-                    cooccurence_scores[ref_word] = {"group1": 0, "group2": 0}
-
-                for attribute_pos, attribute_word in response_words:
-                    token_distance = abs(ref_pos - attribute_pos)
-
-                    if (attribute_word in self.group1_nouns) and (token_distance > 0):
-                        cooccurence_scores[ref_word]["group1"] += pow(
-                            beta, token_distance
-                        )
-
-                    if attribute_word in self.group2_nouns and (token_distance > 0):
-                        cooccurence_scores[ref_word]["group2"] += pow(
-                            beta, token_distance
-                        )
-        return cooccurence_scores
-
-    def _get_clean_token_list(self, text: str) -> List[str]:
+    @staticmethod
+    def _accumulate_cooccurrences(
+        reference_ids: np.ndarray,
+        reference_docs: np.ndarray,
+        reference_positions: np.ndarray,
+        attribute_docs: np.ndarray,
+        attribute_positions: np.ndarray,
+        beta_powers: np.ndarray,
+        n_words: int,
+    ) -> np.ndarray:
         """
-        Get clean token list.
+        Sums the beta-weighted cooccurrences of every reference word occurrence with the attribute word
+        occurrences in the same response, by reference word id. Occurrences must be in corpus order, and
+        `beta_powers[d]` holds the weight of a cooccurrence at token distance d. Reference word occurrences
+        are processed in blocks of about `MAX_PAIRS_PER_BLOCK` occurrence pairs.
         """
-        return [
-            t
-            for t in (self._transform_token(w) for w in word_tokenize(text))
-            if t != ""
-        ]
+        # Attribute occurrences of each response are contiguous, so pair every reference word occurrence
+        # with the slice of attribute occurrences from its response
+        starts = np.searchsorted(attribute_docs, reference_docs, side="left")
+        counts = np.searchsorted(attribute_docs, reference_docs, side="right") - starts
+        cumulative_counts = np.cumsum(counts)
+        n_pairs = int(cumulative_counts[-1]) if len(counts) else 0
+        block_ends = np.searchsorted(
+            cumulative_counts,
+            np.arange(MAX_PAIRS_PER_BLOCK, n_pairs, MAX_PAIRS_PER_BLOCK),
+            side="right",
+        )
+        totals = np.zeros(n_words)
+        for lo, hi in zip([0, *block_ends], [*block_ends, len(counts)]):
+            block_counts = counts[lo:hi]
+            pair_reference = np.repeat(np.arange(lo, hi), block_counts)
+            pair_attribute = np.repeat(
+                starts[lo:hi] - np.cumsum(block_counts) + block_counts, block_counts
+            ) + np.arange(block_counts.sum())
+            # reference words are never attribute words, so every token distance is positive
+            token_distances = np.abs(
+                reference_positions[pair_reference]
+                - attribute_positions[pair_attribute]
+            )
+            totals += np.bincount(
+                reference_ids[pair_reference],
+                weights=beta_powers[token_distances],
+                minlength=n_words,
+            )
+        return totals
 
     @staticmethod
     def _transform_token(w: str) -> str:
         """
         Makes token lowercase, replaces digits with placeholder, and .
         """
-        w = re.sub(r"\d+", "NUMBER", w.lower())  # Replace digits with placeholder
-        w = re.sub(
-            r"^[^A-Za-z<>$]+|[^A-Za-z<>$]+$", "", w
+        w = w.lower()
+        # Fast paths for ASCII tokens without digits, which make up most of the vocabulary
+        if w.isascii() and not any(c.isdigit() for c in w):
+            return w if w.isalpha() else w.strip(ASCII_EDGE_PUNCTUATION)
+        w = DIGITS_PATTERN.sub("NUMBER", w)  # Replace digits with placeholder
+        w = EDGE_PUNCTUATION_PATTERN.sub(
+            "", w
         )  # Remove unwanted characters and leading/trailing punctuation
         return w
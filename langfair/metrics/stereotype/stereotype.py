@@ -14,6 +14,7 @@
 
 from typing import Dict, List, Union
 
+from langfair.metrics.stereotype.corpus import TokenizedCorpus
 from langfair.metrics.stereotype.metrics import (
     CooccurrenceBiasMetric,
     StereotypeClassifier,
@@ -34,7 +35,7 @@ DefaultMetricNames = list(DefaultMetricClasses.keys())
 # Calculate Counterfactual Metrics
 ################################################################################
 class StereotypeMetrics:
-    def __init__(self, metrics: MetricType = DefaultMetricNames, _classifier_model: str = "wu981526092/Sentence-Level-Stereotype-Detector") -> None:
+    def __init__(self, metrics: MetricType = DefaultMetricNames, n_jobs: int = 1, _classifier_model: str = "wu981526092/Sentence-Level-Stereotype-Detector") -> None:
         """
         This class computes few or all Stereotype metrics supported langfair. For more information on these metrics, see Liang et al. (2023) :footcite:`liang2023holisticevaluationlanguagemodels`,
         Bordia & Bowman (2019) :footcite:`bordia2019identifyingreducinggenderbias` and Zekun et al. (2023) :footcite:`zekun2023auditinglargelanguagemodels`.
@@ -44,8 +45,13 @@ class StereotypeMetrics:
         metrics: list of string/objects, default=["Stereotype Association", "Cooccurrence Bias", "Stereotype Classifier"]
             A list containing name or class object of metrics.
 
+        n_jobs : int, default=1
+            Number of worker processes used to tokenize responses for the word-based metrics. If None or -1,
+            one process per CPU is used. Worth raising only for large sets of responses.
+
         """
         self.metrics = metrics
+        self.n_jobs = n_jobs
         self._classifier_model = _classifier_model
         if isinstance(metrics[0], str):
             self.metric_names = metrics
@@ -58,6 +64,7 @@ class StereotypeMetrics:
         prompts: List[str] = None,
         return_data: bool = False,
         categories: List[str] = ["gender", "race"],
+        return_submetrics: bool = False,
     ) -> Dict[str, float]:
         """
         This method evaluate the stereotype metrics values for the provided pair of texts.
@@ -78,15 +85,24 @@ class StereotypeMetrics:
         categories: list, subset of ['gender', 'race']
             Specifies attributes for stereotype classifier metrics. Includes both race and gender by default.
 
+        return_submetrics : bool, default=False
+            Specifies whether to include a dictionary containing the evaluated metric objects, keyed by metric name, in
+            returned result. Their results can then be inspected further, e.g. `word_level_scores` of "Cooccurrence Bias",
+            without evaluating the metrics again.
+
         Returns
         -------
         dict
             Dictionary containing two keys: 'metrics', containing all metric values, and 'data', containing response-level stereotype scores.
+            If `return_submetrics` is True, also contains 'submetrics', containing the evaluated metric objects.
 
         References
         ----------
         .. footbibliography::
         """
+        # Tokenize responses once and share them across the word-based metrics
+        corpus = TokenizedCorpus(responses, n_jobs=self.n_jobs)
+        responses = corpus.responses
         metric_values = {}
         for metric in self.metrics:
             if metric.name in ["Stereotype Classifier"]:
@@ -98,10 +114,15 @@ class StereotypeMetrics:
                 )
                 metric_values.update(tmp_value["metrics"])
             else:
-                metric_values[metric.name] = metric.evaluate(responses=responses)
+                metric_values[metric.name] = metric.evaluate(
+                    responses=responses, corpus=corpus
+                )
+        result = {"metrics": metric_values}
         if return_data:
-            return {"metrics": metric_values, "data": tmp_value["data"]}
-        return {"metrics": metric_values}
+            result["data"] = tmp_value["data"]
+        if return_submetrics:
+            result["submetrics"] = {metric.name: metric for metric in self.metrics}
+        return result
 
     def _default_instances(self) -> None:
         self.metrics = []
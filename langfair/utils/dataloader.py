@@ -110,19 +110,18 @@ def load_realtoxicity(n: Optional[int] = None, subset: Optional[str] = "all"):
             dataset_url=realtoxicity_github_path, output_file_path=resource_path
         )
 
+    # Stream the file and stop once `n` prompts are collected rather than parsing the whole dataset
+    limit = n if n and n > 0 else None
+    prompts = []
     with open(resource_path, "r") as file:
-        # Read each line in the file
-        challenging = []
-        prompts = []
         for line in file:
             # Parse the JSON object from each line
-            challenging.append(json.loads(line)["challenging"])
-            prompts.append(json.loads(line)["prompt"]["text"])
-    if subset == "challenging_only":
-        prompts = [prompts[i] for i in range(len(prompts)) if challenging[i]]
-    if n:
-        if n < len(prompts) and n > 0:
-            prompts = prompts[:n]
+            record = json.loads(line)
+            if subset == "challenging_only" and not record["challenging"]:
+                continue
+            prompts.append(record["prompt"]["text"])
+            if limit is not None and len(prompts) == limit:
+                break
     return prompts
 
 
@@ -12,16 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import itertools
+from types import SimpleNamespace
 
+import numpy as np
 import pytest
+import tiktoken
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
 from langchain_openai import AzureChatOpenAI
 
-from langfair.generator import ResponseGenerator
+from langfair.generator import RateLimiter, ResponseGenerator
+from langfair.generator import rate_limiter as rate_limiter_module
+
+
+@pytest.fixture
+def mock_llm():
+    return AzureChatOpenAI(
+        deployment_name="YOUR-DEPLOYMENT",
+        temperature=1,
+        api_key="SECRET_API_KEY",
+        api_version="2024-05-01-preview",
+        azure_endpoint="https://mocked.endpoint.com",
+    )
 
 
 @pytest.mark.asyncio
-async def test_generator(monkeypatch):
+async def test_generator(monkeypatch, mock_llm):
     count = 3
     MOCKED_PROMPTS = ["Prompt 1", "Prompt 2", "Prompt 3"]
     MOCKED_DUPLICATE_PROMPTS = [
@@ -40,15 +58,7 @@ async def test_generator(monkeypatch):
     async def mock_async_api_call(prompt, count, *args, **kwargs):
         return [MOCKED_RESPONSE_DICT[prompt]] * count
 
-    mock_object = AzureChatOpenAI(
-        deployment_name="YOUR-DEPLOYMENT",
-        temperature=1,
-        api_key="SECRET_API_KEY",
-        api_version="2024-05-01-preview",
-        azure_endpoint="https://mocked.endpoint.com",
-    )
-
-    generator_object = ResponseGenerator(langchain_llm=mock_object)
+    generator_object = ResponseGenerator(langchain_llm=mock_llm)
 
     monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
     data = await generator_object.generate_responses(
@@ -66,6 +76,411 @@ async def test_generator(monkeypatch):
     assert data["metadata"]["non_completion_rate"] == 1 / 3
     assert cost == {
         "Estimated Prompt Token Cost (USD)": 0.001539,
+        "Estimated Cached Token Cost (USD)": 0.0,
         "Estimated Completion Token Cost (USD)": 0.000504,
         "Estimated Total Token Cost (USD)": 0.002043,
     }
+
+    # half of the prompt tokens billed at gpt-4o's 50% cached input rate
+    costs = [
+        await generator_object.estimate_token_cost(
+            tiktoken_model_name="gpt-4o",
+            prompts=MOCKED_DUPLICATE_PROMPTS,
+            example_responses=MOCKED_RESPONSES[:3],
+            count=count,
+            cached_fraction=cached_fraction,
+        )
+        for cached_fraction in [0, 0.5]
+    ]
+    np.testing.assert_allclose(
+        costs[1]["Estimated Prompt Token Cost (USD)"],
+        0.75 * costs[0]["Estimated Prompt Token Cost (USD)"],
+    )
+    np.testing.assert_allclose(
+        costs[1]["Estimated Cached Token Cost (USD)"],
+        0.25 * costs[0]["Estimated Prompt Token Cost (USD)"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_generator_throttling(monkeypatch, mock_llm):
+    in_flight, max_in_flight = 0, 0
+
+    class MockRateLimiter:
+        acquired = 0
+
+        async def __aenter__(self):
+            self.acquired += 1
+
+        async def __aexit__(self, *args):
+            pass
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [prompt] * count
+
+    rate_limiter = MockRateLimiter()
+    generator_object = ResponseGenerator(
+        langchain_llm=mock_llm, max_concurrent=2, rate_limiter=rate_limiter
+    )
+
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+    data = await generator_object.generate_responses(
+        prompts=["Prompt 1", "Prompt 2", "Prompt 3"], count=3
+    )
+
+    assert max_in_flight == 2
+    assert rate_limiter.acquired == 9
+    assert data["data"]["response"] == data["data"]["prompt"]
+
+    for max_concurrent in [0, -1]:
+        with pytest.raises(AssertionError):
+            ResponseGenerator(langchain_llm=mock_llm, max_concurrent=max_concurrent)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter(monkeypatch, mock_llm):
+    rate_limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+    await rate_limiter.aacquire(tokens=500)
+    assert rate_limiter._try_acquire(tokens=100) == 0
+    np.testing.assert_allclose(rate_limiter._try_acquire(tokens=300), 30, rtol=1e-2)
+
+    acquired = []
+
+    async def mock_aacquire(tokens=0):
+        acquired.append(tokens)
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        return [prompt] * count
+
+    mock_llm.max_tokens = 10
+
+    generator_object = ResponseGenerator(
+        langchain_llm=mock_llm, rate_limiter=rate_limiter
+    )
+
+    monkeypatch.setattr(rate_limiter, "aacquire", mock_aacquire)
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+    await generator_object.generate_responses(
+        prompts=["Prompt 1", "A longer prompt 2"], count=2
+    )
+
+    assert len(acquired) == 4
+    assert acquired[0] == acquired[1] < acquired[2] == acquired[3]
+    assert all(tokens > 10 for tokens in acquired)
+
+
+def test_auto_rate_limiter(mock_llm):
+    generator_object = ResponseGenerator(langchain_llm=mock_llm, rate_limiter="auto")
+    assert isinstance(generator_object.rate_limiter, RateLimiter)
+    assert generator_object.rate_limiter.requests_per_minute == 60
+    assert generator_object.rate_limiter.tokens_per_minute == 120_000
+    # requests are paced from the start rather than sent in a burst
+    assert generator_object.rate_limiter._try_acquire(tokens=0) > 0
+
+    with pytest.warns(UserWarning):
+        generator_object = ResponseGenerator(
+            langchain_llm=object(), rate_limiter="auto"
+        )
+    assert generator_object.rate_limiter is None
+
+
+@pytest.mark.asyncio
+async def test_response_cache(monkeypatch, tmp_path, mock_llm):
+    calls = []
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        calls.append(prompt)
+        if prompt == "Prompt 3":
+            return ["Unable to get response"] * count
+        return [prompt + " response"] * count
+
+    cache_file = str(tmp_path / "responses.jsonl")
+    prompts = ["Prompt 1", "Prompt 2", "Prompt 3"]
+
+    generator_object = ResponseGenerator(langchain_llm=mock_llm, cache_file=cache_file)
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+    first = await generator_object.generate_responses(prompts=prompts, count=2)
+    assert len(calls) == 6
+
+    # a new generator reads the cache back from disk; failed responses were not cached
+    calls.clear()
+    generator_object = ResponseGenerator(langchain_llm=mock_llm, cache_file=cache_file)
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+    second = await generator_object.generate_responses(prompts=prompts, count=2)
+    assert calls == ["Prompt 3", "Prompt 3"]
+    assert second["data"] == first["data"]
+
+    # a different system prompt or a larger count misses the cache
+    calls.clear()
+    await generator_object.generate_responses(
+        prompts=prompts[:1], count=2, system_prompt="Be concise."
+    )
+    await generator_object.generate_responses(prompts=prompts[:1], count=3)
+    assert calls == ["Prompt 1"] * 5
+
+
+@pytest.mark.asyncio
+async def test_cacheable_preamble(monkeypatch, mock_llm):
+    sent_messages = []
+
+    async def mock_agenerate(self, messages, *args, **kwargs):
+        sent_messages.append(messages[0])
+        message = AIMessage(
+            content="Mocked response",
+            usage_metadata={
+                "input_tokens": 1100,
+                "output_tokens": 2,
+                "total_tokens": 1102,
+                "input_token_details": {"cache_read": 1024},
+            },
+        )
+        return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+    monkeypatch.setattr(AzureChatOpenAI, "agenerate", mock_agenerate)
+
+    generator_object = ResponseGenerator(langchain_llm=mock_llm)
+    await generator_object.generate_responses(
+        prompts=["Prompt 1", "Prompt 2"],
+        system_prompt="Be concise.",
+        cacheable_preamble="Static instructions.",
+        count=2,
+    )
+
+    assert len(sent_messages) == 4
+    for messages in sent_messages:
+        assert [type(m) for m in messages] == [
+            SystemMessage,
+            SystemMessage,
+            HumanMessage,
+        ]
+        assert [m.content for m in messages[:2]] == [
+            "Static instructions.",
+            "Be concise.",
+        ]
+    assert generator_object.token_usage == {
+        "prompt_tokens": 4400,
+        "cached_tokens": 4096,
+    }
+
+
+@pytest.mark.asyncio
+async def test_stream_responses(monkeypatch, tmp_path, mock_llm):
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        # later prompts complete first
+        await asyncio.sleep(0.01 * (3 - int(prompt[-1])))
+        return [prompt + " response"] * count
+
+    generator_object = ResponseGenerator(
+        langchain_llm=mock_llm, cache_file=str(tmp_path / "responses.jsonl")
+    )
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+
+    prompts = ["Prompt 1", "Prompt 2", "Prompt 3"]
+    rows = [
+        row async for row in generator_object.stream_responses(prompts=prompts, count=2)
+    ]
+    assert [row["prompt"] for row in rows] == [
+        prompt for prompt in reversed(prompts) for _ in range(2)
+    ]
+    assert all(row["response"] == row["prompt"] + " response" for row in rows)
+
+    # streamed responses are cached
+    data = await generator_object.generate_responses(prompts=prompts, count=2)
+    assert len(generator_object.cache) == 3
+    assert sorted(data["data"]["response"]) == sorted(row["response"] for row in rows)
+
+    # workers pause while the consumer is busy rather than buffering every response
+    calls = []
+
+    async def mock_fast_api_call(prompt, count, *args, **kwargs):
+        calls.append(prompt)
+        return [prompt] * count
+
+    generator_object = ResponseGenerator(langchain_llm=mock_llm, max_concurrent=2)
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_fast_api_call)
+    stream = generator_object.stream_responses(
+        prompts=[f"Prompt {i}" for i in range(20)], count=1
+    )
+    await stream.__anext__()
+    await asyncio.sleep(0.05)
+    # one consumed, two buffered and two waiting to be buffered
+    assert len(calls) <= 5
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_prompts(monkeypatch, mock_llm):
+    calls = []
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        calls.append(prompt)
+        return [f"{prompt} response {len(calls)}"] * count
+
+    generator_object = ResponseGenerator(langchain_llm=mock_llm)
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+
+    prompts = ["Prompt 1", "Prompt 2", "Prompt 1"]
+    data = await generator_object.generate_responses(prompts=prompts, count=2)
+    assert sorted(calls) == ["Prompt 1", "Prompt 1", "Prompt 2", "Prompt 2"]
+    assert data["data"]["prompt"] == [prompt for prompt in prompts for _ in range(2)]
+    responses = data["data"]["response"]
+    assert responses[:2] == responses[4:] != responses[2:4]
+    assert len(set(responses[:2])) == 2
+
+    rows = [
+        row async for row in generator_object.stream_responses(prompts=prompts, count=2)
+    ]
+    assert sorted(row["prompt"] for row in rows) == sorted(data["data"]["prompt"])
+
+
+@pytest.mark.asyncio
+async def test_repeated_prompts(monkeypatch, tmp_path, mock_llm):
+    calls = []
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        calls.append(prompt)
+        return [f"{prompt} response {len(calls)}"] * count
+
+    generator_object = ResponseGenerator(
+        langchain_llm=mock_llm,
+        cache_file=str(tmp_path / "responses.jsonl"),
+        dedupe_prompts=False,
+    )
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+
+    # every occurrence of a repeated prompt gets its own responses
+    prompts = ["Prompt 1", "Prompt 2", "Prompt 1"]
+    data = await generator_object.generate_responses(prompts=prompts, count=2)
+    assert len(calls) == 6
+    assert data["data"]["prompt"] == [prompt for prompt in prompts for _ in range(2)]
+    assert len(set(data["data"]["response"])) == 6
+
+    rows = [
+        row async for row in generator_object.stream_responses(prompts=prompts, count=2)
+    ]
+    assert len(calls) == 6
+    assert sorted(row["response"] for row in rows) == sorted(data["data"]["response"])
+
+    # a prompt repeated more often than its cached responses cover is generated again
+    await generator_object.generate_responses(prompts=prompts + ["Prompt 1"], count=2)
+    assert calls[6:] == ["Prompt 1"] * 6
+
+
+@pytest.mark.asyncio
+async def test_token_cache(monkeypatch, tmp_path):
+    prompts = ["Prompt 1", "Prompt 2", "Prompt 3"]
+    responses = ["Mocked response 1", "Mocked response 2"]
+    token_cache_file = str(tmp_path / "tokens.jsonl")
+
+    generator_object = ResponseGenerator(token_cache_file=token_cache_file)
+    cost = await generator_object.estimate_token_cost(
+        tiktoken_model_name="gpt-3.5-turbo-16k-0613",
+        prompts=prompts,
+        example_responses=responses,
+        count=3,
+    )
+
+    # a new generator counts every text from the cache without tokenizing
+    def mock_encode_batch(*args, **kwargs):
+        raise AssertionError("token counts should be read from the cache")
+
+    monkeypatch.setattr(tiktoken.Encoding, "encode_batch", mock_encode_batch)
+    generator_object = ResponseGenerator(token_cache_file=token_cache_file)
+    assert len(generator_object.token_cache) == 8
+    assert cost == await generator_object.estimate_token_cost(
+        tiktoken_model_name="gpt-3.5-turbo-16k-0613",
+        prompts=prompts,
+        example_responses=responses,
+        count=3,
+    )
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_retry(monkeypatch, mock_llm):
+    class RateLimitError(Exception):
+        status_code = 429
+
+    failed = set()
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        if prompt not in failed:
+            failed.add(prompt)
+            raise RateLimitError()
+        if prompt == "Prompt 3":
+            raise ValueError("Not a rate limit error")
+        return [prompt] * count
+
+    rate_limiter = RateLimiter(requests_per_minute=600_000)
+    generator_object = ResponseGenerator(
+        langchain_llm=mock_llm, max_concurrent=2, rate_limiter=rate_limiter
+    )
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+
+    data = await generator_object.generate_responses(
+        prompts=["Prompt 1", "Prompt 2"], count=1
+    )
+    assert data["data"]["response"] == data["data"]["prompt"]
+    # both rate limit errors fall within one backoff window, so the limits are halved once and then
+    # increased by a small step after each successful call
+    assert 0.5 < rate_limiter._scale < 0.55
+
+    with pytest.raises(ValueError):
+        await generator_object.generate_responses(prompts=["Prompt 3"], count=1)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_burst(monkeypatch, mock_llm):
+    # simulate the rate limiter's clock so that waiting for capacity does not slow down the test
+    clock = [0.0]
+
+    async def mock_sleep(seconds):
+        wake_time = clock[0] + seconds
+        await asyncio.sleep(0)
+        clock[0] = max(clock[0], wake_time)
+
+    monkeypatch.setattr(
+        rate_limiter_module, "time", SimpleNamespace(monotonic=lambda: clock[0])
+    )
+    monkeypatch.setattr(
+        rate_limiter_module, "asyncio", SimpleNamespace(sleep=mock_sleep)
+    )
+
+    class RateLimitError(Exception):
+        status_code = 429
+
+    failed = set()
+
+    async def mock_async_api_call(prompt, count, *args, **kwargs):
+        # every call is in flight before the first rate limit error is raised
+        await asyncio.sleep(0)
+        if prompt not in failed:
+            failed.add(prompt)
+            raise RateLimitError()
+        return [prompt] * count
+
+    rate_limiter = RateLimiter(requests_per_minute=60)
+    generator_object = ResponseGenerator(
+        langchain_llm=mock_llm, max_concurrent=10, rate_limiter=rate_limiter
+    )
+    monkeypatch.setattr(generator_object, "_async_api_call", mock_async_api_call)
+
+    prompts = [f"Prompt {i}" for i in range(8)]
+    data = await asyncio.wait_for(
+        generator_object.generate_responses(prompts=prompts, count=1), timeout=10
+    )
+    assert sorted(data["data"]["response"]) == prompts
+    # the burst of 8 rate limit errors halves the limits once
+    assert 0.5 < rate_limiter._scale < 0.6
+
+    # a request is admitted even when the reduced limits allow less than one request per minute
+    rate_limiter = RateLimiter(requests_per_minute=60)
+    for _ in range(6):
+        clock[0] += 60
+        rate_limiter.backoff()
+    assert rate_limiter._scale * rate_limiter.requests_per_minute < 1
+    await asyncio.wait_for(rate_limiter.aacquire(), timeout=10)
@@ -19,11 +19,12 @@ import unittest
 
 import numpy as np
 
-from langfair.metrics.stereotype import StereotypeMetrics
+from langfair.metrics.stereotype import StereotypeMetrics, TokenizedCorpus
 from langfair.metrics.stereotype.metrics import (
     CooccurrenceBiasMetric,
     StereotypeClassifier,
     StereotypicalAssociations,
+    cooccurrence,
 )
 
 datafile_path = "tests/data/stereotype/stereotype_data_file.json"
@@ -59,6 +60,45 @@ def test_coocurrence2():
     np.testing.assert_almost_equal(x, actual_results["test4"], 5)
 
 
+def test_submetrics():
+    stereotypemetrics = StereotypeMetrics(
+        metrics=["Stereotype Association", "Cooccurrence Bias"]
+    )
+    score = stereotypemetrics.evaluate(
+        responses=data["responses"], return_submetrics=True
+    )
+    cobs = score["submetrics"]["Cooccurrence Bias"]
+    np.testing.assert_almost_equal(
+        np.mean(list(cobs.word_level_scores.values())),
+        score["metrics"]["Cooccurrence Bias"],
+    )
+    assert score["metrics"]["Stereotype Association"] == actual_results["test1"]
+
+
+def test_shared_corpus():
+    corpus = TokenizedCorpus(data["responses"])
+    words = list(corpus.vocab)
+    assert [words[i] for i in corpus.token_ids] == [t for d in corpus.tokens for t in d]
+    assert corpus.doc_ids.tolist() == [
+        i for i, d in enumerate(corpus.tokens) for _ in d
+    ]
+    association = StereotypicalAssociations(target_category="adjective")
+    x = association.evaluate(responses=data["responses"], corpus=corpus)
+    assert x == actual_results["test1"]
+    cobs = CooccurrenceBiasMetric(target_category="adjective")
+    x = cobs.evaluate(responses=data["responses"], corpus=corpus)
+    np.testing.assert_almost_equal(x, actual_results["test3"], 5)
+    assert TokenizedCorpus(data["responses"], n_jobs=2).tokens == corpus.tokens
+
+
+def test_coocurrence_blocks(monkeypatch):
+    # accumulating cooccurrences in many small blocks gives the same scores
+    monkeypatch.setattr(cooccurrence, "MAX_PAIRS_PER_BLOCK", 7)
+    cobs = CooccurrenceBiasMetric(target_category="adjective")
+    x = cobs.evaluate(responses=data["responses"])
+    np.testing.assert_almost_equal(x, actual_results["test3"], 5)
+
+
 @unittest.skipIf(
     ((os.getenv("CI") == "true") & (platform.system() == "Darwin")),
     "Skipping test in macOS CI due to memory issues.",